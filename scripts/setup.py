@@ -3,9 +3,11 @@
 setup.py — configure, build, run (with color + UTF-8 friendly output)
 
 - Auto-finds project root (CMakeLists.txt) from scripts/...
+- Uses Ninja when available (sourcing VsDevCmd on Windows), else CMake's default.
 - On Windows, wires CUDA toolset and forces MSBuild colored output.
 - Forces UTF-8 for Python and common tools.
 - Lets you choose config, arch, etc.
+- Uses ccache/sccache as compiler launcher when available (--no-cache to skip).
 
 Usage:
   py -3 scripts\setup.py configure
@@ -14,11 +16,16 @@ Usage:
 """
 
 import argparse
+import functools
+import hashlib
+import json
 import os
 import platform
 import shutil
 import subprocess
 import sys
+from dataclasses import dataclass
+from itertools import chain
 from pathlib import Path
 from typing import List, Optional, Tuple
 
@@ -28,6 +35,13 @@ CUDA_DEFAULT_PATH_WIN = (
     r"C:\Program Files\NVIDIA GPU Computing Toolkit\CUDA\v12.3"
 )
 DEFAULT_CUDA_ARCH = "75"  # override with --cuda-arch
+DEFAULT_CONFIG = "Debug"  # override with --config
+CONFIGURE_FINGERPRINT_FILE = ".setup_py_args_sha256"  # in the build dir
+_IS_WINDOWS = platform.system() == "Windows"
+_EXE_SUFFIX = ".exe" if _IS_WINDOWS else ""
+VSWHERE_DEFAULT_PATH_WIN = (
+    r"C:\Program Files (x86)\Microsoft Visual Studio\Installer\vswhere.exe"
+)
 
 # ---------------------------- helpers --------------------------------
 
@@ -36,24 +50,223 @@ def which_tool(name: str) -> Optional[str]:
     return shutil.which(name)
 
 
+@dataclass(frozen=True)
+class Tools:
+    cmake: Optional[str]
+    ninja: Optional[str]
+    ccache: Optional[str]
+    sccache: Optional[str]
+    distcc: Optional[str]
+    nvcc: Optional[str]
+
+
+@functools.lru_cache(maxsize=1)
+def probe_tools() -> Tools:
+    """
+    Resolve all external tools on PATH once per process (each lookup walks PATH).
+    """
+    return Tools(
+        cmake=which_tool("cmake"),
+        ninja=which_tool("ninja"),
+        ccache=which_tool("ccache"),
+        sccache=which_tool("sccache"),
+        distcc=which_tool("distcc"),
+        nvcc=which_tool("nvcc"),
+    )
+
+
+def default_jobs() -> int:
+    """
+    Number of CPUs usable by this process (honors affinity masks on Linux).
+    """
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def env_parallel_level(env: dict) -> int:
+    """
+    CMAKE_BUILD_PARALLEL_LEVEL from env as an int, 0 if unset or invalid.
+    """
+    value = env.get("CMAKE_BUILD_PARALLEL_LEVEL", "").strip()
+    if not value:
+        return 0
+    try:
+        return max(int(value), 0)
+    except ValueError:
+        print(f"[warn] ignoring invalid CMAKE_BUILD_PARALLEL_LEVEL={value!r}")
+        return 0
+
+
+def detect_default_generator() -> Optional[str]:
+    """
+    Prefer Ninja when it is on PATH; None lets CMake pick its platform default.
+    """
+    return "Ninja" if probe_tools().ninja else None
+
+
+def read_cmake_cache_var(build_dir: Path, name: str) -> Optional[str]:
+    """
+    Value of `name` (any type) in build_dir/CMakeCache.txt, or None.
+    """
+    cache = build_dir / "CMakeCache.txt"
+    if not cache.exists():
+        return None
+    prefix = f"{name}:"
+    for line in cache.read_text(
+        encoding="utf-8", errors="replace"
+    ).splitlines():
+        if line.startswith(prefix):
+            return line.partition("=")[2].strip() or None
+    return None
+
+
+def cached_generator(build_dir: Path) -> Optional[str]:
+    """
+    Generator recorded in an existing CMakeCache.txt (CMake refuses to switch).
+    """
+    return read_cmake_cache_var(build_dir, "CMAKE_GENERATOR")
+
+
+def prepare_msvc_dev_env(env: dict) -> bool:
+    """
+    Make cl.exe/link.exe visible for non-VS generators (e.g. Ninja) on Windows.
+    Sources VsDevCmd.bat from the latest VS install (via vswhere) and merges
+    the resulting environment into env. Returns False if it couldn't.
+    """
+    if env.get("VSINSTALLDIR"):
+        return True  # already inside a VS Developer prompt
+
+    vswhere = Path(
+        os.path.expandvars(
+            r"%ProgramFiles(x86)%\Microsoft Visual Studio\Installer\vswhere.exe"
+        )
+    )
+    if not vswhere.exists():
+        vswhere = Path(VSWHERE_DEFAULT_PATH_WIN)
+    if not vswhere.exists():
+        return False
+
+    res = subprocess.run(
+        [str(vswhere), "-latest", "-property", "installationPath"],
+        capture_output=True,
+        text=True,
+    )
+    vs_path = res.stdout.strip()
+    if res.returncode != 0 or not vs_path:
+        return False
+
+    vsdevcmd = Path(vs_path) / "Common7" / "Tools" / "VsDevCmd.bat"
+    if not vsdevcmd.exists():
+        return False
+
+    res = subprocess.run(
+        f'"{vsdevcmd}" -arch=x64 -no_logo && set',
+        shell=True,
+        capture_output=True,
+        text=True,
+        env=env,
+    )
+    if res.returncode != 0:
+        return False
+    for line in res.stdout.splitlines():
+        key, sep, value = line.partition("=")
+        if sep and key:
+            env[key.upper()] = value
+
+    print(f"[info] Using MSVC environment from: {vs_path}")
+    return True
+
+
+def detect_compiler_cache() -> Optional[Tuple[str, str]]:
+    """
+    Find a compiler cache to use as CMake compiler launcher.
+    Prefers sccache on Windows (stock ccache has no MSVC support), ccache elsewhere.
+    Returns (tool_name, tool_path) or None.
+    """
+    if _IS_WINDOWS:
+        order = ["sccache", "ccache"]
+    else:
+        order = ["ccache", "sccache"]
+    tools = probe_tools()
+    for name in order:
+        path = getattr(tools, name)
+        if path:
+            return name, path
+    return None
+
+
+def prepare_compiler_cache_env(
+    env: dict, tool: str, maxsize: Optional[str]
+) -> dict:
+    """
+    Export cache tuning knobs (ccache only; sccache uses its own config).
+    """
+    if tool != "ccache":
+        return env
+    if maxsize:
+        env["CCACHE_MAXSIZE"] = maxsize
+    env.setdefault(
+        "CCACHE_SLOPPINESS",
+        "pch_defines,time_macros,include_file_mtime,include_file_ctime",
+    )
+    env.setdefault("CCACHE_HARDLINK", "true")
+    return env
+
+
+def compiler_cache_cmake_args(tool: str, tool_path: str) -> List[str]:
+    """
+    CMake args wiring the compiler cache as launcher for C, C++ and CUDA.
+    """
+    args = [
+        f"-DCMAKE_{lang}_COMPILER_LAUNCHER={tool_path}"
+        for lang in ("C", "CXX", "CUDA")
+    ]
+    if tool == "sccache" and _IS_WINDOWS:
+        # /Zi writes a shared PDB which sccache can't cache; embed with /Z7.
+        for lang in ("C", "CXX"):
+            args.append(f"-DCMAKE_{lang}_FLAGS_DEBUG=/Z7 /Ob0 /Od /RTC1")
+            args.append(
+                f"-DCMAKE_{lang}_FLAGS_RELWITHDEBINFO=/Z7 /O2 /Ob1 /DNDEBUG"
+            )
+    return args
+
+
 def run_cmd(
-    cmd: List[str], cwd: Optional[Path] = None, env: Optional[dict] = None
+    cmd: List[str],
+    cwd: Optional[Path] = None,
+    env: Optional[dict] = None,
+    quiet: bool = False,
 ) -> int:
     """
     Run a command streaming stdout/stderr to parent (keeps tool colors if enabled).
+    With quiet, the echo is skipped and the command's output is discarded.
     Returns exit code.
     """
-    print(f"[cmd] {' '.join(cmd)}")
+    if not quiet:
+        print(f"[cmd] {' '.join(cmd)}")
     try:
-        proc = subprocess.Popen(cmd, cwd=str(cwd) if cwd else None, env=env)
-        return proc.wait()
+        code = subprocess.run(
+            cmd,
+            cwd=str(cwd) if cwd else None,
+            env=env,
+            check=False,
+            stdout=subprocess.DEVNULL if quiet else None,
+            stderr=subprocess.STDOUT if quiet else None,
+        ).returncode
     except FileNotFoundError:
         print(f"[error] command not found: {cmd[0]}")
         return 127
+    if quiet and code != 0:
+        print(
+            f"[error] {cmd[0]} failed with exit code {code} (rerun without --quiet)"
+        )
+    return code
 
 
+@functools.lru_cache(maxsize=1)
 def find_project_root(start: Path) -> Path:
-    for p in [start] + list(start.parents):
+    for p in chain((start,), start.parents):
         if (p / "CMakeLists.txt").exists():
             return p
     fallback = start.parent
@@ -63,6 +276,15 @@ def find_project_root(start: Path) -> Path:
     return fallback
 
 
+def is_vs_generator(generator: Optional[str]) -> bool:
+    # None means $CMAKE_GENERATOR if set, else CMake's default (VS on Windows)
+    if generator is None:
+        generator = os.environ.get("CMAKE_GENERATOR")
+        if not generator:
+            return _IS_WINDOWS
+    return generator.startswith("Visual Studio")
+
+
 def prepare_utf8_color_env(base: Optional[dict] = None) -> dict:
     """
     Ensure UTF-8 and ANSI colors are encouraged even without a TTY.
@@ -71,9 +293,7 @@ def prepare_utf8_color_env(base: Optional[dict] = None) -> dict:
     # Unicode/UTF-8
     env.setdefault("PYTHONIOENCODING", "utf-8")
     env.setdefault("PYTHONUTF8", "1")
-    env.setdefault(
-        "LC_ALL", "C.UTF-8" if platform.system() != "Windows" else ""
-    )
+    env.setdefault("LC_ALL", "" if _IS_WINDOWS else "C.UTF-8")
     # ANSI color nudges commonly honored by many tools
     env.setdefault("CLICOLOR", "1")
     env.setdefault("CLICOLOR_FORCE", "1")
@@ -84,23 +304,38 @@ def prepare_utf8_color_env(base: Optional[dict] = None) -> dict:
     return env
 
 
-def prepare_cuda_on_windows(
-    cuda_path_opt: Optional[str], env: dict
-) -> Tuple[dict, List[str]]:
+@functools.lru_cache(maxsize=4)
+def _probe_cuda(cuda_path_opt: Optional[str]) -> Optional[Tuple[Path, Path]]:
     """
-    Prepare CUDA env and extra CMake args for Windows VS generators.
-    Returns (env, extra_cmake_args).
+    Locate (cuda_path, nvcc) once per process; None if the toolkit is missing.
     """
-    extra: List[str] = []
     cuda_path = Path(cuda_path_opt or CUDA_DEFAULT_PATH_WIN)
     if not cuda_path.exists():
         print(f"[warn] CUDA path does not exist: {cuda_path}")
-        return env, extra
+        return None
 
     nvcc = cuda_path / "bin" / "nvcc.exe"
-    if not nvcc.exists():
+    if not nvcc.is_file():
         print(f"[warn] nvcc not found at: {nvcc}")
+        return None
+
+    print(f"[info] Using CUDA at: {cuda_path}")
+    return cuda_path, nvcc
+
+
+def prepare_cuda_on_windows(
+    cuda_path_opt: Optional[str], env: dict, generator: Optional[str] = None
+) -> Tuple[dict, List[str]]:
+    """
+    Prepare CUDA env and extra CMake args for Windows generators.
+    The CUDA toolset hint is only passed to VS generators (Ninja rejects it).
+    Returns (env, extra_cmake_args).
+    """
+    extra: List[str] = []
+    probed = _probe_cuda(cuda_path_opt)
+    if probed is None:
         return env, extra
+    cuda_path, nvcc = probed
 
     # Env
     env["CUDA_PATH"] = str(cuda_path)
@@ -108,66 +343,315 @@ def prepare_cuda_on_windows(
     env["PATH"] = str(cuda_path / "bin") + os.pathsep + env.get("PATH", "")
 
     # CMake toolset + CUDA compiler hint
-    extra.append(f"-DCMAKE_GENERATOR_TOOLSET=cuda={cuda_path}")
+    if is_vs_generator(generator):
+        extra.append(f"-DCMAKE_GENERATOR_TOOLSET=cuda={cuda_path}")
     extra.append(f"-DCMAKE_CUDA_COMPILER={nvcc}")
-
-    print(f"[info] Using CUDA at: {cuda_path}")
     return env, extra
 
 
 # ---------------------------- CMake steps -----------------------------
 
 
+def is_multi_arch(cuda_arch: Optional[str]) -> bool:
+    return bool(cuda_arch) and (
+        ";" in cuda_arch or cuda_arch.startswith("all")
+    )
+
+
+def _last_define_index(args: List[str], var: str) -> int:
+    # Index of the last -D<var>=... or -D<var>:TYPE=... in args, -1 if none
+    for i in range(len(args) - 1, -1, -1):
+        name, sep, _ = args[i].partition("=")
+        if sep and name.split(":", 1)[0] == f"-D{var}":
+            return i
+    return -1
+
+
+def cmake_define_value(args: List[str], var: str) -> Optional[str]:
+    """
+    Value of the last -D<var>=... in args (the one CMake keeps), or None.
+    """
+    i = _last_define_index(args, var)
+    return args[i].partition("=")[2] if i >= 0 else None
+
+
+def merge_cmake_flags(
+    args: List[str], var: str, flags: str, base: str = ""
+) -> None:
+    """
+    Append flags (in place) to the last -D<var>=... (or -D<var>:TYPE=...)
+    in args, or add -D<var>=<base> <flags> if there is none.
+    """
+    i = _last_define_index(args, var)
+    if i < 0:
+        args.append(f"-D{var}={base} {flags}" if base else f"-D{var}={flags}")
+        return
+    name, _, value = args[i].partition("=")
+    args[i] = f"{name}={value} {flags}" if value else f"{name}={flags}"
+
+
+def _args_fingerprint(
+    source_dir: Path,
+    build_dir: Path,
+    config: Optional[str],
+    cuda_arch: Optional[str],
+    extra_cmake_args: List[str],
+    compiler_cache: Optional[Tuple[str, str]],
+    generator: Optional[str],
+    distcc_mode: Optional[str] = None,
+) -> str:
+    payload = [
+        str(source_dir),
+        str(build_dir),
+        config,
+        cuda_arch,
+        list(extra_cmake_args),
+        list(compiler_cache) if compiler_cache else None,
+        generator,
+        distcc_mode,
+    ]
+    return hashlib.sha256(json.dumps(payload).encode()).hexdigest()
+
+
+def configure_is_current(build_dir: Path, fingerprint: str) -> bool:
+    """
+    True if build_dir was configured by us with the same arguments.
+    """
+    if not (build_dir / "CMakeCache.txt").exists():
+        return False
+    try:
+        stamp = (build_dir / CONFIGURE_FINGERPRINT_FILE).read_text()
+    except OSError:
+        return False
+    return stamp.strip() == fingerprint
+
+
+def clear_configure_fingerprint(build_dir: Path) -> None:
+    # A failed configure still rewrites CMakeCache.txt, so never let an old
+    # stamp vouch for it
+    try:
+        (build_dir / CONFIGURE_FINGERPRINT_FILE).unlink(missing_ok=True)
+    except OSError as e:
+        print(f"[warn] could not remove configure fingerprint: {e}")
+
+
+def write_configure_fingerprint(build_dir: Path, fingerprint: str) -> None:
+    try:
+        (build_dir / CONFIGURE_FINGERPRINT_FILE).write_text(fingerprint + "\n")
+    except OSError as e:
+        print(f"[warn] could not write configure fingerprint: {e}")
+
+
+def _detect_toolchain_mismatch(
+    build_dir: Path, config: Optional[str], cuda_arch: Optional[str]
+) -> bool:
+    """
+    True if build_dir's CMakeCache.txt was configured for another build type
+    (single-config generators only) or CUDA architecture list.
+    Pass None for values the user didn't ask for explicitly: defaults must
+    not wipe a tree configured with other settings.
+    """
+    if not (build_dir / "CMakeCache.txt").exists():
+        return False
+    multi_config = read_cmake_cache_var(build_dir, "CMAKE_CONFIGURATION_TYPES")
+    cached_config = read_cmake_cache_var(build_dir, "CMAKE_BUILD_TYPE")
+    if config and not multi_config and cached_config not in (None, config):
+        print(f"[info] build type changed: {cached_config} -> {config}")
+        return True
+    cached_arch = read_cmake_cache_var(build_dir, "CMAKE_CUDA_ARCHITECTURES")
+    if cuda_arch and cached_arch not in (None, cuda_arch):
+        print(
+            f"[info] CUDA architectures changed: {cached_arch} -> {cuda_arch}"
+        )
+        return True
+    return False
+
+
+def wipe_build_dir(source_dir: Path, build_dir: Path) -> None:
+    """
+    Remove a configured build dir so the next configure starts clean
+    (a compiler cache keeps the rebuild cheap).
+    """
+    if not (build_dir / "CMakeCache.txt").exists():
+        return
+    build_res, source_res = build_dir.resolve(), source_dir.resolve()
+    if build_res == source_res or build_res in source_res.parents:
+        print(
+            f"[warn] refusing to delete {build_dir}: it contains the sources"
+        )
+        return
+    print(f"[info] removing stale build dir: {build_dir}")
+    shutil.rmtree(build_dir, ignore_errors=True)
+
+
+def _is_compile_commands_copy(path: Path, build_dir: Path) -> bool:
+    # A copy we made: every entry was compiled from within build_dir
+    try:
+        entries = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return False
+    if not isinstance(entries, list):
+        return False
+    build_res = build_dir.resolve()
+    for entry in entries:
+        if not isinstance(entry, dict) or "directory" not in entry:
+            return False
+        d = Path(entry["directory"]).resolve()
+        if d != build_res and build_res not in d.parents:
+            return False
+    return True
+
+
+def link_compile_commands(source_dir: Path, build_dir: Path) -> None:
+    """
+    Expose build_dir/compile_commands.json at the source root for clangd/IWYU.
+    Symlinks when possible, copies otherwise (e.g. Windows without dev mode).
+    Only our own link or copy is ever replaced.
+    """
+    target = build_dir / "compile_commands.json"
+    if not target.exists():
+        return  # not produced by this generator (e.g. Visual Studio)
+    link = source_dir / "compile_commands.json"
+    if link == target:
+        return
+    if link.is_symlink():
+        if link.resolve() == target.resolve():
+            return
+        print(
+            f"[warn] leaving {link} alone: it links elsewhere "
+            f"({os.readlink(link)}); remove it to use {target}"
+        )
+        return
+    if link.exists():
+        if not _is_compile_commands_copy(link, build_dir):
+            print(
+                f"[warn] leaving {link} alone: not generated from "
+                f"{build_dir}; remove it to use {target}"
+            )
+            return
+        link.unlink()  # our previous copy, possibly stale
+    try:
+        link.symlink_to(target)
+    except OSError:
+        try:
+            shutil.copyfile(target, link)
+        except OSError as e:
+            print(
+                "[warn] could not place compile_commands.json in "
+                f"{source_dir}: {e}"
+            )
+
+
+def unlink_compile_commands(source_dir: Path, build_dir: Path) -> None:
+    """
+    Remove our link or copy of build_dir/compile_commands.json, if any.
+    """
+    target = build_dir / "compile_commands.json"
+    link = source_dir / "compile_commands.json"
+    if link == target:
+        return
+    if link.is_symlink():
+        ours = link.resolve() == target.resolve()
+    else:
+        ours = link.exists() and _is_compile_commands_copy(link, build_dir)
+    if ours:
+        try:
+            link.unlink()
+        except OSError as e:
+            print(f"[warn] could not remove {link}: {e}")
+
+
 def cmake_configure(
     source_dir: Path,
     build_dir: Path,
-    config: str,
+    config: Optional[str],
     cuda_arch: Optional[str],
     extra_cmake_args: List[str],
     env: dict,
+    compiler_cache: Optional[Tuple[str, str]] = None,
+    generator: Optional[str] = None,
+    quiet: bool = False,
 ) -> None:
     build_dir.mkdir(parents=True, exist_ok=True)
     cmd = ["cmake", "-S", str(source_dir), "-B", str(build_dir)]
+    if generator:
+        cmd += ["-G", generator]
     if config:
         cmd += [f"-DCMAKE_BUILD_TYPE={config}"]
     if cuda_arch:
         cmd += [f"-DCMAKE_CUDA_ARCHITECTURES={cuda_arch}"]
     # Encourage colored diagnostics (Clang/GCC)
     cmd += ["-DCMAKE_COLOR_DIAGNOSTICS=ON"]
+    # Compiler cache launchers go first so user args can override them
+    if compiler_cache:
+        cmd += compiler_cache_cmake_args(*compiler_cache)
+    elif not is_vs_generator(generator):
+        # Launchers persist in CMakeCache.txt; clear one set by an earlier run
+        cmd += [
+            f"-DCMAKE_{lang}_COMPILER_LAUNCHER="
+            for lang in ("C", "CXX", "CUDA")
+        ]
     cmd += extra_cmake_args
-    code = run_cmd(cmd, env=env)
+    code = run_cmd(cmd, env=env, quiet=quiet)
     if code != 0:
         sys.exit(code)
 
 
 def cmake_build(
-    build_dir: Path, config: str, parallel: Optional[int], env: dict
+    build_dir: Path,
+    config: str,
+    parallel: Optional[int],
+    env: dict,
+    generator: Optional[str] = None,
+    quiet: bool = False,
 ) -> None:
+    # Precedence: --parallel > $CMAKE_BUILD_PARALLEL_LEVEL > default_jobs()
+    if parallel is None or parallel <= 0:
+        parallel = env_parallel_level(env) or default_jobs()
+
     cmd = ["cmake", "--build", str(build_dir)]
     if config:
         cmd += ["--config", config]
+    # Portable across generators (maps to -j for Make/Ninja, /m for MSBuild)
+    cmd += ["--parallel", str(parallel)]
+    # Nested CMake invocations (e.g. ExternalProject) inherit it
+    env["CMAKE_BUILD_PARALLEL_LEVEL"] = str(parallel)
 
-    # Append tool-specific color/parallel flags
-    if platform.system() == "Windows":
+    # Append tool-specific color flags
+    if _IS_WINDOWS and is_vs_generator(generator):
         # MSBuild colored output
         msbuild_color = "/consoleloggerparameters:ForceConsoleColor;WarningColor=Cyan;ErrorColor=Yellow"
-        if parallel and parallel > 0:
-            cmd += ["--", f"/m:{parallel}", msbuild_color]
-        else:
-            cmd += ["--", msbuild_color]
-    else:
-        # Ninja/Make: -j plus many tools honor CLICOLOR/TERM already
-        if parallel and parallel > 0:
-            cmd += ["--", f"-j{parallel}"]
+        cmd += ["--", msbuild_color]
 
-    code = run_cmd(cmd, env=env)
+    code = run_cmd(cmd, env=env, quiet=quiet)
     if code != 0:
         sys.exit(code)
 
 
-def exe_candidates(build_dir: Path, target: str, config: str) -> List[Path]:
-    exe_name = f"{target}.exe" if platform.system() == "Windows" else target
-    candidates = [
+def exe_candidates(
+    build_dir: Path, target: str, config: str
+) -> Tuple[Path, ...]:
+    # str keys: Path equality/hash is platform-dependent (case, drives)
+    return _exe_candidates(str(build_dir), target, config)
+
+
+@functools.lru_cache(maxsize=32)
+def _exe_candidates(
+    build_dir_str: str, target: str, config: str
+) -> Tuple[Path, ...]:
+    build_dir = Path(build_dir_str)
+    exe_name = f"{target}{_EXE_SUFFIX}"
+    candidates = []
+    # If the output dir is pinned in the cache, look there first
+    runtime_dir = read_cmake_cache_var(
+        build_dir, "CMAKE_RUNTIME_OUTPUT_DIRECTORY"
+    )
+    if runtime_dir:
+        out = Path(runtime_dir)
+        if not out.is_absolute():
+            out = build_dir / out
+        candidates += [out / exe_name, out / config / exe_name]
+    candidates += [
         build_dir / exe_name,
         build_dir / "bin" / exe_name,
         build_dir / config / exe_name,
@@ -181,27 +665,65 @@ def exe_candidates(build_dir: Path, target: str, config: str) -> List[Path]:
         if p not in seen:
             unique.append(p)
             seen.add(p)
-    return unique
+    return tuple(unique)
 
 
 def find_executable(build_dir: Path, target: str, config: str) -> Path:
-    for cand in exe_candidates(build_dir, target, config):
-        if cand.exists():
-            return cand
-    return exe_candidates(build_dir, target, config)[0]
+    cands = exe_candidates(build_dir, target, config)
+    return next((c for c in cands if c.is_file()), cands[0])
 
 
-def run_executable(exe: Path, run_args: List[str], env: dict) -> int:
-    if not exe.exists():
+def run_executable(
+    exe: Path, run_args: List[str], env: dict, quiet: bool = False
+) -> int:
+    if not exe.is_file():
         print(f"[warn] executable not found at: {exe}")
     cmd = [str(exe)] + run_args
-    print(f"[run] {' '.join(cmd)}")
+    if not quiet:
+        print(f"[run] {' '.join(cmd)}")
     try:
-        proc = subprocess.Popen(cmd, env=env)
-        return proc.wait()
+        # Inherit stdout/stderr so the benchmark's colors pass through as-is
+        return subprocess.run(
+            cmd,
+            env=env,
+            stdout=subprocess.DEVNULL if quiet else None,
+            stderr=subprocess.STDOUT if quiet else None,
+            check=False,
+            close_fds=True,
+        ).returncode
     except FileNotFoundError:
         print("[error] failed to start process (file not found)")
         return 127
+    except OSError as e:
+        print(f"[error] failed to start process: {e}")
+        return 126
+
+
+def exec_executable(
+    exe: Path, run_args: List[str], env: dict, quiet: bool = False
+) -> int:
+    """
+    Replace this Python process with the executable (POSIX), so no parent
+    stays resident during the benchmark and signals go straight to it.
+    On Windows or with quiet (output must be discarded), uses run_executable
+    instead and returns its exit code. If exec itself fails, returns 127/126
+    (not found / can't execute) like a shell would.
+    """
+    if not _IS_WINDOWS and exe.is_file() and not quiet:
+        cmd = [str(exe)] + run_args
+        print(f"[run] {' '.join(cmd)}")
+        # exec discards Python's buffers
+        sys.stdout.flush()
+        sys.stderr.flush()
+        try:
+            os.execvpe(cmd[0], cmd, env)
+        except FileNotFoundError as e:
+            print(f"[error] failed to start process: {e}")
+            return 127
+        except OSError as e:
+            print(f"[error] failed to start process: {e}")
+            return 126
+    return run_executable(exe, run_args, env, quiet)
 
 
 # ---------------------------- CLI ------------------------------------
@@ -226,20 +748,32 @@ def parse_args(argv: List[str]) -> Tuple[argparse.Namespace, List[str]]:
         )
         p.add_argument(
             "--config",
-            default="Debug",
+            default=None,
             choices=["Debug", "Release", "RelWithDebInfo", "MinSizeRel"],
-            help="Build configuration.",
+            help=(
+                "Build configuration. Default: the build dir's cached one, "
+                f"else {DEFAULT_CONFIG}."
+            ),
         )
         p.add_argument(
             "--target",
             default=DEFAULT_TARGET,
             help=f"Target executable name. Default: {DEFAULT_TARGET}",
         )
+        p.add_argument(
+            "--generator",
+            "-G",
+            default=None,
+            help="CMake generator. Default: Ninja if found, else CMake's default.",
+        )
         p.add_argument(
             "--parallel",
             type=int,
             default=None,
-            help="Parallel build jobs (e.g., 8).",
+            help=(
+                "Parallel build jobs (e.g., 8). Default: $CMAKE_BUILD_PARALLEL_LEVEL "
+                "if set, else number of usable CPUs."
+            ),
         )
         p.add_argument(
             "--cuda-path",
@@ -251,13 +785,104 @@ def parse_args(argv: List[str]) -> Tuple[argparse.Namespace, List[str]]:
         )
         p.add_argument(
             "--cuda-arch",
-            default=DEFAULT_CUDA_ARCH,
-            help=f"Value for CMAKE_CUDA_ARCHITECTURES (default: {DEFAULT_CUDA_ARCH}).",
+            default=None,
+            help=(
+                "Value for CMAKE_CUDA_ARCHITECTURES. Default: the build dir's "
+                f"cached one, else {DEFAULT_CUDA_ARCH}."
+            ),
+        )
+        p.add_argument(
+            "--nvcc-threads",
+            type=int,
+            default=None,
+            help=(
+                "nvcc --threads=N for per-arch codegen in parallel (0 = all cores). "
+                "Default: 0 for multi-arch builds, unset otherwise."
+            ),
         )
         p.add_argument(
             "--export-compile-commands",
             action="store_true",
-            help="Pass -DCMAKE_EXPORT_COMPILE_COMMANDS=ON at configure.",
+            help="Kept for compatibility; compile_commands.json is now exported by default.",
+        )
+        p.add_argument(
+            "--no-compile-commands",
+            action="store_true",
+            help=(
+                "Pass -DCMAKE_EXPORT_COMPILE_COMMANDS=OFF and remove our "
+                "compile_commands.json link from source-dir."
+            ),
+        )
+        p.add_argument(
+            "--unity",
+            action="store_true",
+            help=(
+                "Pass -DCMAKE_UNITY_BUILD=ON (batch sources into unity TUs). "
+                "CUDA sources are only batched by CMake 3.31+."
+            ),
+        )
+        p.add_argument(
+            "--unity-batch-size",
+            type=int,
+            default=16,
+            help="Sources per unity TU with --unity (default: 16).",
+        )
+        p.add_argument(
+            "--no-unity",
+            action="append",
+            default=[],
+            metavar="PATH",
+            help=(
+                "Source (relative to source-dir) kept out of unity batches, "
+                "e.g. a file under active edit. Repeatable; needs --unity."
+            ),
+        )
+        p.add_argument(
+            "--no-cache",
+            action="store_true",
+            help="Do not use ccache/sccache as compiler launcher even if found.",
+        )
+        p.add_argument(
+            "--ccache-maxsize",
+            default=None,
+            help="Value for CCACHE_MAXSIZE (e.g., 5G). Default: ccache's own.",
+        )
+        p.add_argument(
+            "--distcc",
+            action="store_true",
+            help=(
+                "Distribute C/C++ compilation with distcc "
+                "(chained behind ccache when it is used)."
+            ),
+        )
+        p.add_argument(
+            "--distcc-hosts",
+            default=None,
+            help="Value for DISTCC_HOSTS (default: inherited from the environment).",
+        )
+        p.add_argument(
+            "--quiet",
+            action="store_true",
+            help="Discard CMake/build output and [cmd] echoes (e.g. for CI loops).",
+        )
+        p.add_argument(
+            "--quiet-run",
+            action="store_true",
+            help="With --quiet, also discard the executable's output.",
+        )
+        p.add_argument(
+            "--fresh",
+            action="store_true",
+            help=(
+                "Delete the build dir before configuring. Done automatically "
+                "when an explicit --config/--cuda-arch (or the matching "
+                "--cmake -D override) differs from the cached one."
+            ),
+        )
+        p.add_argument(
+            "--force-configure",
+            action="store_true",
+            help="Re-run CMake configure even if its arguments are unchanged.",
         )
         p.add_argument(
             "--cmake",
@@ -272,10 +897,10 @@ def parse_args(argv: List[str]) -> Tuple[argparse.Namespace, List[str]]:
     add_common(sub.add_parser("all", help="Configure, build, and run"))
 
     # Preserve anything after "--" as runtime args for the executable.
-    if "--" in argv:
+    try:
         idx = argv.index("--")
         known, rest = argv[:idx], argv[idx + 1 :]
-    else:
+    except ValueError:
         known, rest = argv, []
 
     args = parser.parse_args(known)
@@ -299,70 +924,245 @@ def main() -> None:
     if not build_dir.is_absolute():
         build_dir = (source_dir / build_dir).resolve()
 
-    if not which_tool("cmake"):
+    if not probe_tools().cmake:
         print("[error] cmake not found in PATH")
         sys.exit(127)
 
+    # Explicit values (CLI or a later --cmake -D) drive the stale-cache check
+    user_cmake_args = args.cmake or []
+    wanted_config = cmake_define_value(user_cmake_args, "CMAKE_BUILD_TYPE")
+    if wanted_config is None:
+        wanted_config = args.config
+    wanted_arch = cmake_define_value(
+        user_cmake_args, "CMAKE_CUDA_ARCHITECTURES"
+    )
+    if wanted_arch is None:
+        wanted_arch = args.cuda_arch
+
+    # Start from scratch rather than reuse a cache for another toolchain setup
+    if args.action != "run" and (
+        args.fresh
+        or _detect_toolchain_mismatch(build_dir, wanted_config, wanted_arch)
+    ):
+        wipe_build_dir(source_dir, build_dir)
+
+    # Effective values: a missing flag keeps what an existing tree was
+    # configured with (None leaves the -D out); defaults only for new trees
+    configured = (build_dir / "CMakeCache.txt").exists()
+
+    def effective(cli: Optional[str], var: str, default: str) -> Optional[str]:
+        if cli is not None:
+            return cli
+        if configured:
+            return read_cmake_cache_var(build_dir, var)
+        return default
+
+    config = effective(args.config, "CMAKE_BUILD_TYPE", DEFAULT_CONFIG)
+    cuda_arch = effective(
+        args.cuda_arch, "CMAKE_CUDA_ARCHITECTURES", DEFAULT_CUDA_ARCH
+    )
+    # Build/run still need a config (e.g. multi-config generators)
+    build_config = config or DEFAULT_CONFIG
+
     # Base env: UTF-8 + color
     env = prepare_utf8_color_env()
 
-    # Export compile_commands.json for tooling, if asked
-    extra_cmake_args: List[str] = []
-    if args.export_compile_commands:
-        extra_cmake_args.append("-DCMAKE_EXPORT_COMPILE_COMMANDS=ON")
+    # Export compile_commands.json for tooling, unless opted out (explicit
+    # OFF: the setting persists in CMakeCache.txt)
+    extra_cmake_args: List[str] = [
+        "-DCMAKE_EXPORT_COMPILE_COMMANDS="
+        + ("OFF" if args.no_compile_commands else "ON")
+    ]
+
+    # Generator: explicit > already configured > $CMAKE_GENERATOR > Ninja
+    requested_generator = (
+        args.generator
+        or cached_generator(build_dir)
+        or env.get("CMAKE_GENERATOR")
+    )
+    generator = requested_generator or detect_default_generator()
+    auto_detected = not requested_generator
+    if (
+        _IS_WINDOWS
+        and generator
+        and generator.startswith("Ninja")
+        and not prepare_msvc_dev_env(env)
+    ):
+        # Only a freshly auto-detected Ninja may fall back: an explicit,
+        # env-selected or already-configured one must stay
+        if auto_detected:
+            print("[info] vswhere/VsDevCmd not found, using VS generator")
+            generator = None
+        else:
+            print(
+                "[warn] MSVC environment not found; Ninja may not find cl.exe"
+            )
 
     # CUDA wiring on Windows (same pattern as your other project)
-    if platform.system() == "Windows":
-        env, cuda_cmake_args = prepare_cuda_on_windows(args.cuda_path, env)
+    if _IS_WINDOWS:
+        env, cuda_cmake_args = prepare_cuda_on_windows(
+            args.cuda_path, env, generator
+        )
         extra_cmake_args += cuda_cmake_args
 
+    # Compiler cache (ccache/sccache) as launcher, unless disabled.
+    # VS generators ignore *_COMPILER_LAUNCHER, so don't wire it there.
+    compiler_cache = None
+    if not args.no_cache:
+        compiler_cache = detect_compiler_cache()
+        if compiler_cache and is_vs_generator(generator):
+            print(
+                f"[info] {compiler_cache[0]} found but unused: "
+                "VS generators don't support compiler launchers"
+            )
+            compiler_cache = None
+    if compiler_cache:
+        print(f"[info] Using compiler cache: {compiler_cache[1]}")
+        env = prepare_compiler_cache_env(
+            env, compiler_cache[0], args.ccache_maxsize
+        )
+
+    # distcc: ccache wraps distcc when both are active, else it is the
+    # C/C++ launcher itself (unlike CC/CXX, also applies to configured dirs)
+    distcc_mode: Optional[str] = None
+    if args.distcc:
+        distcc = probe_tools().distcc
+        if not distcc:
+            print("[warn] distcc not found in PATH, ignoring --distcc")
+        elif is_vs_generator(generator):
+            print("[warn] VS generators can't use distcc, ignoring --distcc")
+        elif compiler_cache and compiler_cache[0] != "ccache":
+            print(
+                f"[warn] {compiler_cache[0]} can't chain distcc, "
+                "ignoring --distcc (use --no-cache to distribute instead)"
+            )
+        elif compiler_cache:
+            distcc_mode = "ccache-prefix"
+            env["CCACHE_PREFIX"] = "distcc"
+        else:
+            distcc_mode = "launcher"
+            extra_cmake_args += [
+                f"-DCMAKE_{lang}_COMPILER_LAUNCHER={distcc}"
+                for lang in ("C", "CXX")
+            ]
+        if distcc_mode:
+            env["DISTCC_HOSTS"] = args.distcc_hosts or env.get(
+                "DISTCC_HOSTS", ""
+            )
+
+    # Unity (jumbo) builds: amortize shared header parsing across sources
+    # (CMakeLists.txt warns when the CMake in use can't batch CUDA sources)
+    if args.unity:
+        extra_cmake_args.append("-DCMAKE_UNITY_BUILD=ON")
+        extra_cmake_args.append(
+            f"-DCMAKE_UNITY_BUILD_BATCH_SIZE={args.unity_batch_size}"
+        )
+    else:
+        # Cached from an earlier --unity run otherwise
+        extra_cmake_args.append("-DCMAKE_UNITY_BUILD=OFF")
+    unity_exclude = args.no_unity
+    if unity_exclude and not args.unity:
+        print("[warn] --no-unity has no effect without --unity, ignoring it")
+        unity_exclude = []
+    # Always passed (empty if none) so an earlier exclusion doesn't stick
+    extra_cmake_args.append(f"-DBENCH_UNITY_EXCLUDE={';'.join(unity_exclude)}")
+
     # Pass along user-provided extra cmake args after --cmake ...
     extra_cmake_args += args.cmake or []
 
-    if args.action == "configure":
+    # nvcc: generate code for several archs in parallel within one invocation
+    nvcc_threads = args.nvcc_threads
+    if nvcc_threads is None and is_multi_arch(cuda_arch):
+        nvcc_threads = 0
+    if nvcc_threads is not None:
+        # Without a --cmake -DCMAKE_CUDA_FLAGS, keep what CMake would use:
+        # the cached flags once configured, else $CUDAFLAGS (its seed)
+        if (build_dir / "CMakeCache.txt").exists():
+            base = read_cmake_cache_var(build_dir, "CMAKE_CUDA_FLAGS") or ""
+        else:
+            base = env.get("CUDAFLAGS", "")
+        base = " ".join(
+            f for f in base.split() if not f.startswith("--threads=")
+        )
+        merge_cmake_flags(
+            extra_cmake_args,
+            "CMAKE_CUDA_FLAGS",
+            f"--threads={nvcc_threads}",
+            base,
+        )
+
+    fingerprint = _args_fingerprint(
+        source_dir,
+        build_dir,
+        config,
+        cuda_arch,
+        extra_cmake_args,
+        compiler_cache,
+        # Requested generator only: the effective one is read back from
+        # CMakeCache.txt after the first configure and would always differ.
+        args.generator,
+        distcc_mode,
+    )
+
+    def configure() -> None:
+        clear_configure_fingerprint(build_dir)
         cmake_configure(
             source_dir,
             build_dir,
-            args.config,
-            args.cuda_arch,
+            config,
+            cuda_arch,
             extra_cmake_args,
             env,
+            compiler_cache,
+            generator,
+            args.quiet,
         )
-        return
+        write_configure_fingerprint(build_dir, fingerprint)
+        if args.no_compile_commands:
+            unlink_compile_commands(source_dir, build_dir)
+        else:
+            link_compile_commands(source_dir, build_dir)
 
-    if args.action == "build":
+    def configure_if_needed() -> None:
         if not (build_dir / "CMakeCache.txt").exists():
             print(
                 "[info] build dir not configured yet, running configure first..."
             )
-            cmake_configure(
-                source_dir,
-                build_dir,
-                args.config,
-                args.cuda_arch,
-                extra_cmake_args,
-                env,
-            )
-        cmake_build(build_dir, args.config, args.parallel, env)
+            configure()
+        elif args.force_configure or not configure_is_current(
+            build_dir, fingerprint
+        ):
+            configure()
+        else:
+            print("[info] configure args unchanged, skipping configure")
+
+    if args.action == "configure":
+        configure()
+        return
+
+    if args.action == "build":
+        configure_if_needed()
+        cmake_build(
+            build_dir, build_config, args.parallel, env, generator, args.quiet
+        )
         return
 
     if args.action == "run":
-        exe = find_executable(build_dir, args.target, args.config)
-        code = run_executable(exe, run_args, env)
+        exe = find_executable(build_dir, args.target, build_config)
+        code = exec_executable(
+            exe, run_args, env, args.quiet and args.quiet_run
+        )
         sys.exit(code)
 
     if args.action == "all":
-        cmake_configure(
-            source_dir,
-            build_dir,
-            args.config,
-            args.cuda_arch,
-            extra_cmake_args,
-            env,
+        configure_if_needed()
+        cmake_build(
+            build_dir, build_config, args.parallel, env, generator, args.quiet
+        )
+        exe = find_executable(build_dir, args.target, build_config)
+        code = exec_executable(
+            exe, run_args, env, args.quiet and args.quiet_run
         )
-        cmake_build(build_dir, args.config, args.parallel, env)
-        exe = find_executable(build_dir, args.target, args.config)
-        code = run_executable(exe, run_args, env)
         sys.exit(code)
 
 